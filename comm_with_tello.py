@@ -9,8 +9,9 @@ manager = SwarmManager(*ROUTER_SSID_PASSWORD)
 manager.find_drones_on_network(1)
 drones: List[TelloDrone] = manager.get_connected_drones()
 
-drones[0].takeoff()
-manager.sync()
-print("sync complete")
+if manager.broadcast(b"takeoff"):
+    print("sync complete")
+else:
+    print("takeoff timed out")
 drones[0].land()
 drones[0].shutdown()
@@ -1,18 +1,9 @@
-from typing import List, Tuple
-from swarm_manager import TelloDrone, SwarmManager
-from math import radians, sin, cos
+from swarm_manager import SwarmManager
+import numpy as np
 
 # Set according to individual's wifi environment
 ROUTER_SSID_PASSWORD = "U+Net2AE6", "1C4C024328"
 
-class DroneVector(object):
-    def __init__(self, x: float, y: float) -> None:
-        self.x = x
-        self.y = y
-
-    def __repr__(self) -> str:
-        return f"M({self.x: .4f}, {self.y: .4f})"
-
 class Formation(object):
     def __init__(self, manager):
         self._center_x: float = 0
@@ -34,24 +25,18 @@ class Formation(object):
                 drones[idx].yaw = 0
 
     # get vectors for each drone on launch point to form a formation
-    def _get_vectors_to_move_formation_of(self, radius: float) -> List[DroneVector]:
-        drones: List[TelloDrone] = self._manager.get_connected_drones()
-        angle: float = 360 / len(drones)
-        vectors: List[DroneVector] = []
+    # returns (n, 2) array of (x, y) per drone
+    def _get_vectors_to_move_formation_of(self, radius: float) -> np.ndarray:
+        count: int = len(self._manager.get_connected_drones())
+        rad: np.ndarray = np.deg2rad(np.arange(count) * (360 / count))
 
         # assume the default yaw is 0
         self._center_y = radius
 
-        for (idx, drone) in enumerate(drones):
-            deg: float = angle * idx
-            rad: float = radians(deg)
-            x: float = self._center_x + (radius * sin(rad))
-            y: float = self._center_y + (radius * cos(rad))
-            
-            vector = DroneVector(x - drone.x, y - drone.y)
-            vectors.append(vector)
+        xs: np.ndarray = self._center_x + (radius * np.sin(rad))
+        ys: np.ndarray = self._center_y + (radius * np.cos(rad))
 
-        return vectors
+        return np.stack([xs - self._manager._x, ys - self._manager._y], axis=1)
 
     # move drones to formation and align them to 0 degrees
     def form_formation_of(self, radius: float) -> None:
@@ -63,24 +48,14 @@ class Formation(object):
         for drone in drones:
             drone.move(x, y)
 
-    def _get_rotations_to_video_formation(self) -> List[int]:
-        drones: List[TelloDrone] = self._manager.get_connected_drones()
-        angle: float = 360 / len(drones)
-        rotations: List[int] = []
+    def _get_rotations_to_video_formation(self) -> np.ndarray:
+        count: int = len(self._manager.get_connected_drones())
+        deg: np.ndarray = np.arange(count) * (360 / count)
+        yaw: np.ndarray = ((deg + 180) % 360).astype(np.int32)
 
-        for (idx, drone) in enumerate(drones):
-            deg: float = angle * idx
-            yaw: int = int((deg + 180) % 360)
-            
-            rotation = 0
-            yaw_delta = yaw - drone.yaw
-            if yaw_delta < 0:
-                rotation = 360 + yaw_delta
-            if yaw_delta > 180:
-                rotation = yaw_delta - 360
-            rotations.append(rotation)
-
-        return rotations
+        # wrap into [-180, 180) so each drone takes the shorter way around
+        yaw_delta: np.ndarray = yaw - self._manager._yaw
+        return ((yaw_delta + 180) % 360) - 180
 
     def start_photography(self) -> None:
         drones = self._manager.get_connected_drones()
@@ -88,7 +63,7 @@ class Formation(object):
 
         # rotate drones to focus on object
         for (idx, drone) in enumerate(drones):
-            drone.rotate(rotations[idx])
+            drone.rotate(int(rotations[idx]))
 
         # TODO: circle drones around center
 
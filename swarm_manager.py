@@ -1,36 +1,101 @@
+import ipaddress
+import logging
+import select
+import selectors
 import socket
 import time
-from threading import Thread, Lock
-from typing import List, Optional, Tuple
-import netifaces, netaddr
+from collections import deque
+from functools import lru_cache
+from threading import Event, Lock, Thread
+from typing import Deque, Dict, List, Optional, Set, Tuple
+import netifaces
+import numpy as np
+
+log = logging.getLogger(__name__)
 
 # Tello's default address when in station mode is 192.168.10.1
 TELLO_DEFAULT_ADDR = ("192.168.10.1", 8889)
 # Tello uses IPv4, UDP for connection
 TELLO_SOCK_PROTOCOL = socket.AF_INET, socket.SOCK_DGRAM
+# Tello answers a query well within this on a LAN
+PROBE_TIMEOUT = 0.1
+# How long to collect replies after asking every ip of the subnets at once
+SWEEP_TIMEOUT = 0.5
+# How long each readiness probe collects replies while waiting for a drone to rejoin
+QUICK_PROBE_TIMEOUT = 0.4
+# How often to probe for a drone rejoining, and how long to keep trying at most
+REJOIN_POLL_INTERVAL = 0.5
+REJOIN_TIMEOUT = 15.0
+# How long a lookup of the possible ips stays valid, interfaces rarely change
+POSSIBLE_IPS_TTL = 30.0
+# How long to listen for replies to a broadcast, over all interfaces
+BROADCAST_TIMEOUT = 1.5
+# Tello ACKs a command only once it's done, and flying one can take many seconds
+# Give up on an ACK after this long, so a lost datagram can't stall a drone for good
+ACK_TIMEOUT = 30.0
+# After giving up on an ACK, hold the drone's next command until the late ACK shows up or this long passed,
+# so the late ACK isn't taken for the next command's
+STALE_ACK_GRACE = 5.0
+# Tello's go command accepts at most this many cm per axis
+GO_MAX_DIST = 500
+# Tello's go command needs at least one axis outside of -20..20 cm
+GO_MIN_DIST = 20
+
+# Fixed SDK commands, encoded once
+_CMD_COMMAND = b"command"
+_CMD_SN = b"sn?"
+_CMD_TAKEOFF = b"takeoff"
+_CMD_LAND = b"land"
+_CMD_SHUTDOWN = b"shutdown"
+
+# UDP socket for talking to Tellos that never blocks
+# Created non-blocking in one call where the platform has SOCK_NONBLOCK
+def _nonblocking_socket() -> socket.socket:
+    if hasattr(socket, 'SOCK_NONBLOCK'):
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM | socket.SOCK_NONBLOCK)
+    sock = socket.socket(*TELLO_SOCK_PROTOCOL)
+    sock.setblocking(False)
+    return sock
+
+# Encoded "go" command for a move by (x, y, z)
+# Drones tend to repeat the same grid steps, so the payloads are cached
+@lru_cache(maxsize=256)
+def _go_command(x: int, y: int, z: int, speed: int) -> bytes:
+    # Tello's go takes (forward, left, up), while our frame is (right, forward, up)
+    return b"go %d %d %d %d" % (y, -x, z, speed)
 
 class TelloDrone(object):
     # manager: TelloDrone
     def __init__(self, sock: socket.socket, serial: str, ip: str, manager) -> None:
+        # connected to the drone, None once it's shut down
         self._sock = sock
         self._serial: str = serial
         self.ip: str = ip
         self.name: str = None
 
-        self.x: float = 0
-        self.y: float = 0
-        self.z: float = 0
-        self.yaw: int = 0
-
-        self._command_queue: List[str] = []
-        self._queue_lock = Lock()
-        self._thread = Thread(target=self._command_thread)
-        self._thread.start()
-
         self._manager = manager
+        # x, y and yaw live in manager's arrays so formations can be computed in bulk
+        self._index: int = manager._add_position()
+        self.z: float = 0
 
-    def __del__(self):
-        self._thread.join()
+        # displacement and speed of batched moves, not queued yet
+        self._pending_move: List[int] = [0, 0, 0]
+        self._pending_speed: int = 0
+
+        # encoded commands, guarded by manager's dispatch lock
+        self._command_queue: Deque[bytes] = deque()
+        # command sent to the drone whose ACK hasn't arrived yet
+        self._in_flight: Optional[bytes] = None
+        # time.monotonic() after which the in-flight command counts as lost
+        self._ack_deadline: float = 0
+        # time.monotonic() until which the next command is held back after an ACK got lost, 0 if not held
+        self._hold_until: float = 0
+        # set while there is nothing queued or in flight
+        self._idle_event = Event()
+        self._idle_event.set()
+        # ACKs are read into one buffer, only touched by manager's dispatcher thread
+        self._recv_buf = bytearray(1024)
+        self._recv_mv = memoryview(self._recv_buf)
 
     def __repr__(self) -> str:
         if self.name:
@@ -39,6 +104,30 @@ class TelloDrone(object):
             # only use last 4 digits of serial
             return f"Tello {self._serial[-4:]}@{self.ip}"
 
+    @property
+    def x(self) -> float:
+        return float(self._manager._x[self._index])
+
+    @x.setter
+    def x(self, value: float) -> None:
+        self._manager._x[self._index] = value
+
+    @property
+    def y(self) -> float:
+        return float(self._manager._y[self._index])
+
+    @y.setter
+    def y(self, value: float) -> None:
+        self._manager._y[self._index] = value
+
+    @property
+    def yaw(self) -> int:
+        return int(self._manager._yaw[self._index])
+
+    @yaw.setter
+    def yaw(self, value: int) -> None:
+        self._manager._yaw[self._index] = value
+
     # Rotate the drone by given angle
     # 0 <= abs(angle) <= 180 
     # positive angle: clockwise
@@ -52,8 +141,28 @@ class TelloDrone(object):
             # no need to move when angle == 0
             pass
         
-    def move(self, x: int, y: int, z: int = 0, speed: int = 30):
-        self._enqueue_command(f"go {y} {-x} {z} {speed}")
+    # Move the drone by (x, y, z)
+    # batch: hold the move back and merge it with the following ones into a single go,
+    #        queued with the next other command or flush()
+    def move(self, x: int, y: int, z: int = 0, speed: int = 30, batch: bool = False):
+        # a zero move adds nothing to the pending go, only a non-batched call's flush remains
+        if x == y == z == 0:
+            if not batch:
+                self.flush()
+            return
+        merged = [pending + delta for (pending, delta) in zip(self._pending_move, (x, y, z))]
+        too_far = any(abs(dist) > GO_MAX_DIST for dist in merged)
+        # e.g. 30 then -20 would merge into a 10 cm go the drone rejects, while both parts are fine alone
+        # cancelling out completely is fine though, nothing gets sent then
+        too_short = any(self._pending_move) and any(merged) and all(abs(dist) <= GO_MIN_DIST for dist in merged)
+        if too_far or too_short:
+            self.flush()
+            merged = [x, y, z]
+        self._pending_move = merged
+        self._pending_speed = speed
+        if not batch:
+            self.flush()
+
         self.x += x
         self.y += y
         self.z += z
@@ -64,137 +173,335 @@ class TelloDrone(object):
 
     # Terminate connection between Drone and PC
     def shutdown(self):
-        self._enqueue_command("shutdown")
+        self._enqueue_bytes(_CMD_SHUTDOWN)
 
     def takeoff(self):
-        self._enqueue_command("takeoff")
+        self._enqueue_bytes(_CMD_TAKEOFF)
 
     def land(self):
-        self._enqueue_command("land")
+        self._enqueue_bytes(_CMD_LAND)
+
+    # Hold the rest of the queued commands until manager sends the signal
+    def wait(self, signal: str):
+        self._enqueue_bytes(b"wait " + signal.encode('utf-8'))
 
     def _forward(self, dist: int):
-        self._enqueue_command(f"forward {dist}")
+        self._enqueue_bytes(b"forward %d" % dist)
 
     def _back(self, dist: int):
-        self._enqueue_command(f"back {dist}")
+        self._enqueue_bytes(b"back %d" % dist)
 
     def _speed(self, speed: int):
-        self._enqueue_command(f"speed {speed}")
+        self._enqueue_bytes(b"speed %d" % speed)
 
     def _clockwise(self, angle: int):
-        self._enqueue_command(f"cw {angle}")
+        self._enqueue_bytes(b"cw %d" % angle)
 
     def _counter_clockwise(self, angle: int):
-        self._enqueue_command(f"ccw {angle}")
+        self._enqueue_bytes(b"ccw %d" % angle)
 
     def _up(self, dist: int):
-        self._enqueue_command(f"up {dist}")
+        self._enqueue_bytes(b"up %d" % dist)
 
     def _down(self, dist: int):
-        self._enqueue_command(f"down {dist}")
-
-    def _send_command(self, cmd: str):
-        self._sock.sendto(cmd.encode('utf-8'), (self.ip, 8889))
-        response, addr = self._sock.recvfrom(1024)
-        print(f"response from {addr}: {response.decode('utf-8')}")
-
-    def _enqueue_command(self, cmd: str):
-        with self._queue_lock:
+        self._enqueue_bytes(b"down %d" % dist)
+
+    # Queue the batched moves as one go command
+    def flush(self) -> None:
+        (x, y, z) = self._pending_move
+        if x == y == z == 0:
+            return
+        self._pending_move = [0, 0, 0]
+        self._append_command(_go_command(x, y, z, self._pending_speed))
+
+    def _enqueue_bytes(self, cmd: bytes):
+        # batched moves go before anything queued after them
+        self.flush()
+        self._append_command(cmd)
+
+    def _append_command(self, cmd: bytes):
+        with self._manager._dispatch_lock:
             self._command_queue.append(cmd)
+            self._idle_event.clear()
+        self._manager._wake_dispatcher()
 
     def _is_complete(self) -> bool:
-        with self._queue_lock:
-            if self._command_queue:
-                return False
-            else:
-                return True
-
-    def _command_thread(self):
-        while self._sock:
-            self._queue_lock.acquire()
-            if self._command_queue:
-                command = self._command_queue.pop(0)
-                if command == "shutdown":
-                    self._sock = None
-                else:
-                    self._send_command(command)
-            self._queue_lock.release()
-            time.sleep(0.1)
+        return self._idle_event.is_set()
 
 class SwarmManager(object):
     def __init__(self, wifi_ssid: str, wifi_pwd: str) -> None:
         self._drones: List[TelloDrone] = []
         self._ssid: str = wifi_ssid
         self._pwd: str  = wifi_pwd
-        self._control_sock = socket.socket(*TELLO_SOCK_PROTOCOL)
         self._video_sock = socket.socket(*TELLO_SOCK_PROTOCOL)
-        self._control_sock.bind(('', 9000))
         self._video_sock.bind(('', 6038))
-        self._signals = {}
-        self._signals_lock = Lock()
+        # raised signals, guarded by the dispatch lock
+        self._signals: Dict[str, bool] = {}
+        # hosts of each subnet seen so far, keyed by (iface, own address, netmask)
+        self._cached_possible_ips: Dict[Tuple[str, str, str], List[str]] = {}
+        # (time.monotonic() of the lookup, ips) of the last _get_possible_ips
+        self._ip_cache: Optional[Tuple[float, List[str]]] = None
+        # guards drone command queues and in-flight commands
+        self._dispatch_lock = Lock()
+        self._dispatcher: Optional[Thread] = None
+        # whether a dispatcher is serving the drones, guarded by the dispatch lock
+        # cleared by the dispatcher itself under the lock, right as it decides to return
+        self._dispatcher_running: bool = False
+        # drone sockets and the wakeup socket, for the dispatcher to wait on
+        self._selector = selectors.DefaultSelector()
+        # a byte on this pair wakes the dispatcher when there may be something to send
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._selector.register(self._wakeup_recv, selectors.EVENT_READ)
+
+        # positions of drones, indexed in the same order as self._drones
+        self._x: np.ndarray = np.zeros(0)
+        self._y: np.ndarray = np.zeros(0)
+        self._yaw: np.ndarray = np.zeros(0, dtype=np.int32)
 
     # Given that this PC is connected to Tello in Station mode,
     # switch Tello to AP mode and add the drone instance once the mode's switched
     def add_drone_to_network(self) -> None:
-        self._change_drone_mode()
-        # time to shut down, reboot, connect to wifi, ...
-        time.sleep(15)
-        self.find_drones_on_network(1)
+        serial = self._change_drone_mode()
+        # give it time to shut down, reboot, connect to wifi, ...
+        # but go on as soon as it answers
+        tello: Optional[Tuple[str, str]] = None
+        deadline = time.monotonic() + REJOIN_TIMEOUT
+        while time.monotonic() < deadline:
+            next_probe = time.monotonic() + REJOIN_POLL_INTERVAL
+            # this PC may be moving to the drone's network meanwhile, so look interfaces up again
+            self._ip_cache = None
+            tello = self._quick_probe(serial)
+            if tello is not None:
+                break
+            time.sleep(max(0.0, min(next_probe, deadline) - time.monotonic()))
+
+        if tello is not None:
+            self._add_drones([tello])
+        else:
+            # it didn't answer in time, look for whichever drone is there
+            self.find_drones_on_network(1)
+
+    # Get (ip, serial) of the Tello with given serial if it answers on the subnets
+    # Other Tellos that aren't added yet may answer too, so every responder is collected
+    def _quick_probe(self, serial: str) -> Optional[Tuple[str, str]]:
+        added_ips: Set[str] = {drone.ip for drone in self._drones}
+        possible_ips = [ip for ip in self._get_possible_ips() if ip not in added_ips]
+        for tello in self._find_drones_by_sweep(possible_ips, len(possible_ips), QUICK_PROBE_TIMEOUT):
+            if tello[1] == serial:
+                return tello
+        return None
 
     # Find drones on AP mode and create drone instance from it
     def find_drones_on_network(self, num: int) -> None:
-        tellos: List[Tuple[str, str]] = self._find_drones_online(num)
-        self._control_sock.settimeout(None)
+        self._add_drones(self._find_drones_online(num))
 
+    # Create drone instances for (ip, serial) of Tellos in SDK mode
+    def _add_drones(self, tellos: List[Tuple[str, str]]) -> None:
         for (ip, serial) in tellos:
-            tello = TelloDrone(self._control_sock, serial, ip, self)
-            self._drones.append(tello)
+            # a connected socket per drone spares the kernel a route lookup on every send
+            sock = _nonblocking_socket()
+            sock.bind(('', 0))
+            sock.connect((ip, 8889))
+
+            tello = TelloDrone(sock, serial, ip, self)
+            self._selector.register(sock, selectors.EVENT_READ, tello)
+            with self._dispatch_lock:
+                self._drones.append(tello)
+                # decided under the same lock the dispatcher decides to return under,
+                # so a dispatcher on its way out is never counted on to serve the new drone
+                start_dispatcher = not self._dispatcher_running
+                self._dispatcher_running = True
+            if start_dispatcher:
+                self._start_dispatcher()
                 
         print(self._drones)       
 
-
     def get_connected_drones(self) -> List[TelloDrone]:
         return self._drones
 
+    # Make room for one more drone in the position arrays and return its index
+    def _add_position(self) -> int:
+        self._x = np.append(self._x, np.zeros(1, dtype=self._x.dtype))
+        self._y = np.append(self._y, np.zeros(1, dtype=self._y.dtype))
+        self._yaw = np.append(self._yaw, np.zeros(1, dtype=self._yaw.dtype))
+        return len(self._x) - 1
+
     # Get ips of Tellos in network
     def _find_drones_online(self, num: int) -> List[Tuple[str, str]]:
-        possible_ips = self._get_possible_ips()
-        already_added_ips: List[str] = [drone.ip for drone in self._drones]
+        already_added_ips: Set[str] = {drone.ip for drone in self._drones}
+
+        # Tellos usually answer a broadcast, which saves scanning the subnet
+        tello_ips: List[Tuple[str, str]] = self._find_drones_by_broadcast(already_added_ips, num)[:num]
+        if len(tello_ips) == num:
+            return tello_ips
+
+        # otherwise ask every remaining ip at once
+        found_ips = already_added_ips | {ip for (ip, _) in tello_ips}
+        possible_ips = [ip for ip in self._get_possible_ips() if ip not in found_ips]
+        tello_ips.extend(self._find_drones_by_sweep(possible_ips, num - len(tello_ips)))
+
+        return tello_ips
+
+    # Send "command" to every ip from one socket, then collect up to num Tellos that answered
+    # All probes wait out the same deadline, instead of a timeout each
+    def _find_drones_by_sweep(self, possible_ips: List[str], num: int,
+                              timeout: float = SWEEP_TIMEOUT) -> List[Tuple[str, str]]:
+        candidates: Set[str] = set(possible_ips)
+        responders: List[str] = []
+
+        sock = _nonblocking_socket()
+        try:
+            for ip in possible_ips:
+                try:
+                    sock.sendto(_CMD_COMMAND, (ip, 8889))
+                except OSError:
+                    continue
+
+            # every reply is read into the same buffer
+            recv_buf = bytearray(1024)
+            recv_mv = memoryview(recv_buf)
+            deadline = time.monotonic() + timeout
+            while len(responders) < num:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    nbytes, (ip, _) = sock.recvfrom_into(recv_buf)
+                except BlockingIOError:
+                    select.select([sock], [], [], remaining)
+                    continue
+                if recv_mv[:nbytes] == b"ok" and ip in candidates and ip not in responders:
+                    responders.append(ip)
+
+            # responders are in SDK mode now, only their serials are missing
+            serials = self._query_serials(sock, responders)
+            tello_ips: List[Tuple[str, str]] = [(ip, serials[ip]) for ip in responders if ip in serials]
+        finally:
+            sock.close()
+
+        return tello_ips
+
+    # Broadcast "command" on every subnet at once and return the Tellos that answered
+    # Stops listening as soon as num new Tellos have answered
+    def _find_drones_by_broadcast(self, already_added_ips: Set[str], num: int) -> List[Tuple[str, str]]:
+        selector = selectors.DefaultSelector()
+        socks: List[socket.socket] = []
+        responders: List[str] = []
+
+        try:
+            # one socket per interface, so every subnet is asked at the same time
+            for (_, address, network) in self._get_subnets():
+                sock = _nonblocking_socket()
+                socks.append(sock)
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+                    sock.bind((address, 0))
+                    # broadcasts are easily dropped, so send it twice
+                    for _ in range(2):
+                        sock.sendto(_CMD_COMMAND, (str(network.broadcast_address), 8889))
+                except OSError:
+                    continue
+                selector.register(sock, selectors.EVENT_READ)
+
+            # collect responders from all interfaces until the deadline, reading into one buffer
+            recv_buf = bytearray(1024)
+            recv_mv = memoryview(recv_buf)
+            deadline = time.monotonic() + BROADCAST_TIMEOUT
+            while selector.get_map() and len(responders) < num:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                for (key, _) in selector.select(remaining):
+                    try:
+                        nbytes, (ip, _) = key.fileobj.recvfrom_into(recv_buf)
+                    except OSError:
+                        continue
+                    if recv_mv[:nbytes] != b"ok":
+                        continue
+                    if ip not in already_added_ips and ip not in responders:
+                        responders.append(ip)
+        finally:
+            selector.close()
+            for sock in socks:
+                sock.close()
+
+        # responders are in SDK mode already, only their serials are missing
+        # a drone reachable from several interfaces answers more than once
         tello_ips: List[Tuple[str, str]] = []
-        
-        sock = self._control_sock
+        seen_serials: Set[str] = set()
+        sock = _nonblocking_socket()
+        try:
+            serials = self._query_serials(sock, responders)
+        finally:
+            sock.close()
+        for ip in responders:
+            serial = serials.get(ip)
+            if serial is None or serial in seen_serials:
+                continue
+            seen_serials.add(serial)
+            tello_ips.append((ip, serial))
 
-        for ip in possible_ips:
-            # do not try to connect if that ip is already added
-            if ip in already_added_ips:
+        return tello_ips
+
+    # Ask every Tello in SDK mode among ips for its serial number at once
+    # Replies are collected until one shared PROBE_TIMEOUT deadline, so a silent drone costs no extra wait
+    # sock must be non-blocking
+    def _query_serials(self, sock: socket.socket, ips: List[str]) -> Dict[str, str]:
+        serials: Dict[str, str] = {}
+        for ip in ips:
+            try:
+                sock.sendto(_CMD_SN, (ip, 8889))
+            except OSError:
                 continue
-            print(f"trying for {ip}")
-            # lots of ips to scan...
-            sock.settimeout(0.1)
+
+        pending: Set[str] = set(ips)
+        recv_buf = bytearray(1024)
+        recv_mv = memoryview(recv_buf)
+        deadline = time.monotonic() + PROBE_TIMEOUT
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
             try:
-                # establish connection with drone
-                comm = "command"
-                sock.sendto(comm.encode('utf-8'), (ip, 8889))
-                response, _ = sock.recvfrom(1024)
-                if response.decode('utf-8') == "ok":
-                    comm = "sn?"
-                    sock.sendto(comm.encode('utf-8'), (ip, 8889))
-                    response, _ = sock.recvfrom(1024)
-                    serial = response.decode('utf-8')
-                    tello_ips.append((ip, serial))
-                    if len(tello_ips) == num:
-                        break
-                else:
-                    raise ConnectionRefusedError
+                nbytes, (ip, _) = sock.recvfrom_into(recv_buf)
+            except BlockingIOError:
+                select.select([sock], [], [], remaining)
+                continue
             except OSError:
                 continue
-        
-        return tello_ips
+            # skip late replies to an earlier query, like a repeated "ok" to "command"
+            if ip not in pending or recv_mv[:nbytes] == b"ok":
+                continue
+            pending.discard(ip)
+            serials[ip] = str(recv_mv[:nbytes], 'utf-8')
+
+        return serials
 
     # Get entire IPs on a subnet
+    # Interfaces are looked up again after POSSIBLE_IPS_TTL, and each subnet's hosts are enumerated only once
     def _get_possible_ips(self) -> List[str]:
+        if self._ip_cache is not None and time.monotonic() - self._ip_cache[0] < POSSIBLE_IPS_TTL:
+            return self._ip_cache[1]
+
         ips: List[str] = []
 
+        for (iface, address, network) in self._get_subnets():
+            key = (iface, address, str(network.netmask))
+            if key not in self._cached_possible_ips:
+                own_ip = ipaddress.IPv4Address(address)
+                # hosts() already leaves out network and broadcast address
+                self._cached_possible_ips[key] = [str(ip) for ip in network.hosts() if ip != own_ip]
+            ips.extend(self._cached_possible_ips[key])
+
+        self._ip_cache = (time.monotonic(), ips)
+        return ips
+
+    # Get (interface, own address, network) of every /24 subnet this PC is on
+    def _get_subnets(self) -> List[Tuple[str, str, ipaddress.IPv4Network]]:
+        subnets: List[Tuple[str, str, ipaddress.IPv4Network]] = []
+
         for iface in netifaces.interfaces():
             addr = netifaces.ifaddresses(iface)
 
@@ -209,41 +516,59 @@ class SwarmManager(object):
             if netmask != '255.255.255.0':
                 continue
 
-            # Create ip object and get
-            subnet = netaddr.IPNetwork(f'{address}/{netmask}')
-            network = netaddr.IPNetwork(f"{subnet.network}/{netmask}")
-            for ip in network:
-                if str(ip).split('.')[3] not in ['0', '255'] and str(ip) != address:
-                    ips.append(str(ip))
-        
-        return ips
+            # Create network object, host bits of address are dropped
+            network = ipaddress.IPv4Network(f"{address}/{netmask}", strict=False)
+            subnets.append((iface, address, network))
+
+        return subnets
 
     # Switch the Tello in Station Mode to AP mode,
     # and connect the Tello to designated wifi AP
-    def _change_drone_mode(self) -> None:
+    # Returns the Tello's serial number
+    def _change_drone_mode(self) -> str:
         # Tello uses IPv4 and UDP
         sock = socket.socket(*TELLO_SOCK_PROTOCOL)
         sock.settimeout(5)
+        recv_buf = bytearray(1024)
+        recv_mv = memoryview(recv_buf)
         
         try:
-            # check connection btw/ Tello and PC
-            comm = "command"
-            sock.sendto(comm.encode('utf-8'), TELLO_DEFAULT_ADDR)
-            response, _ = sock.recvfrom(1024)
-            if response.decode('utf-8') != "ok":
+            # check connection btw/ Tello and PC, and get serial number from Tello
+            comms = [_CMD_COMMAND, _CMD_SN]
+            try:
+                # Tello takes SDK commands back to back, so don't wait a round trip for each
+                for comm in comms:
+                    sock.sendto(comm, TELLO_DEFAULT_ADDR)
+                responses = [str(recv_mv[:sock.recv_into(recv_buf)], 'utf-8') for _ in comms]
+            except socket.timeout:
+                # a datagram got lost, go through the commands one at a time
+                # on a fresh socket, so a late reply from the first round can't be taken for an answer
+                sock.close()
+                sock = socket.socket(*TELLO_SOCK_PROTOCOL)
+                sock.settimeout(5)
+                responses = []
+                for comm in comms:
+                    sock.sendto(comm, TELLO_DEFAULT_ADDR)
+                    nbytes = sock.recv_into(recv_buf)
+                    responses.append(str(recv_mv[:nbytes], 'utf-8'))
+                    if responses[0] != "ok":
+                        break
+
+            if responses[0] != "ok":
                 raise ConnectionRefusedError
-            
-            # get serial number from Tello
-            comm = "sn?"
-            sock.sendto(comm.encode('utf-8'), TELLO_DEFAULT_ADDR)
-            response, _ = sock.recvfrom(1024)
-            serial = response.decode('utf-8')
-
-            # switch the Tello mode
-            comm = f"ap {self._ssid} {self._pwd}"
-            sock.sendto(comm.encode('utf-8'), TELLO_DEFAULT_ADDR)
-            response, _ = sock.recvfrom(1024)
-            print(f"{response.decode('utf-8')} from {serial}")
+            serial = responses[1]
+
+            # then switch the Tello mode, only once the handshake went through
+            # never sent twice, the Tello reboots as soon as it gets it
+            sock.sendto(f"ap {self._ssid} {self._pwd}".encode('utf-8'), TELLO_DEFAULT_ADDR)
+            try:
+                nbytes = sock.recv_into(recv_buf)
+                result = str(recv_mv[:nbytes], 'utf-8')
+            except socket.timeout:
+                # it may reboot without answering, the rejoin probe tells whether it switched
+                result = "no reply to ap"
+            print(f"{result} from {serial}")
+            return serial
 
         # timeout: failed to connect to Tello for 5 seconds
         except OSError:
@@ -252,13 +577,183 @@ class SwarmManager(object):
         finally:
             sock.close()
 
-    def sync(self):
-        wait = True
-        while wait:
-            wait = False
-            for drone in self._drones:
-                if not drone._is_complete():
-                    wait = True
-                    break
-            time.sleep(0.1)
+    def _start_dispatcher(self) -> None:
+        self._dispatcher = Thread(target=self._dispatch_thread)
+        self._dispatcher.start()
+
+    # Single thread sending commands for every drone and reading their ACKs
+    def _dispatch_thread(self) -> None:
+        while True:
+            self._flush_outbound()
+            with self._dispatch_lock:
+                # keep running until every drone has been shut down
+                if not any(drone._sock for drone in self._drones):
+                    self._dispatcher_running = False
+                    return
+
+            for (key, _) in self._selector.select(self._time_to_next_deadline()):
+                if key.data is None:
+                    self._drain_wakeups()
+                else:
+                    self._receive_ack(key.data)
+
+            self._expire_lost_acks()
+
+    # Make the dispatcher look for commands to send
+    def _wake_dispatcher(self) -> None:
+        try:
+            self._wakeup_send.send(b"\0")
+        except BlockingIOError:
+            # buffer is full of wakeups the dispatcher hasn't read yet
+            pass
 
+    def _drain_wakeups(self) -> None:
+        try:
+            while self._wakeup_recv.recv(1024):
+                pass
+        except BlockingIOError:
+            pass
+
+    # Get the command at the head of an idle drone's queue, dropping waits already signalled
+    # Returns None if the queue is empty or the drone is waiting for a signal
+    # Caller must hold the dispatch lock
+    def _next_command(self, drone: TelloDrone) -> Optional[bytes]:
+        while drone._command_queue:
+            command = drone._command_queue[0]
+            if not command.startswith(b"wait "):
+                return command
+            if not self._signals.get(command[5:].decode('utf-8')):
+                return None
+
+            drone._command_queue.popleft()
+            if not drone._command_queue:
+                drone._idle_event.set()
+
+        return None
+
+    # Pop the next command of every idle drone and send them all at once
+    def _flush_outbound(self) -> None:
+        msgs: List[Tuple[TelloDrone, bytes]] = []
+        now = time.monotonic()
+
+        with self._dispatch_lock:
+            for drone in self._drones:
+                # Tello ACKs a command only after executing it,
+                # so only one command may be in flight per drone
+                if drone._sock is None or drone._in_flight:
+                    continue
+                if drone._hold_until:
+                    if now < drone._hold_until:
+                        continue
+                    drone._hold_until = 0
+
+                command = self._next_command(drone)
+                if command is None:
+                    continue
+                drone._command_queue.popleft()
+                if command == _CMD_SHUTDOWN:
+                    self._selector.unregister(drone._sock)
+                    drone._sock.close()
+                    drone._sock = None
+                    drone._idle_event.set()
+                    continue
+                drone._in_flight = command
+                drone._ack_deadline = time.monotonic() + ACK_TIMEOUT
+                msgs.append((drone, command))
+
+        for (drone, command) in msgs:
+            try:
+                drone._sock.send(command)
+            except OSError as err:
+                # e.g. the drone's port became unreachable, don't wait for an ACK then
+                log.warning("failed to send %s to %s: %s", command, drone.ip, err)
+                with self._dispatch_lock:
+                    self._complete_command(drone)
+
+    # Read the ACK waiting on drone's socket
+    def _receive_ack(self, drone: TelloDrone) -> None:
+        try:
+            nbytes = drone._sock.recv_into(drone._recv_buf)
+        except ConnectionRefusedError as err:
+            # the socket is connected, so an ICMP port unreachable shows up here
+            # the command won't be ACKed then, don't wait ACK_TIMEOUT for it
+            log.warning("failed to reach %s: %s", drone.ip, err)
+            with self._dispatch_lock:
+                self._complete_command(drone)
+            return
+        except OSError:
+            # not readable after all
+            return
+
+        # skip decoding entirely unless someone reads it
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("response from %s: %s", drone.ip, str(drone._recv_mv[:nbytes], 'utf-8'))
+        with self._dispatch_lock:
+            if drone._in_flight is None:
+                # late ACK of a command given up on, don't count it for the next one
+                drone._hold_until = 0
+                return
+            self._complete_command(drone)
+
+    # Seconds until the earliest in-flight command times out or a held drone may go on,
+    # None if there is neither
+    def _time_to_next_deadline(self) -> Optional[float]:
+        with self._dispatch_lock:
+            deadlines = [drone._ack_deadline for drone in self._drones if drone._in_flight]
+            deadlines.extend(drone._hold_until for drone in self._drones if drone._hold_until)
+        if not deadlines:
+            return None
+        return max(0, min(deadlines) - time.monotonic())
+
+    # Free drones whose ACK never arrived
+    def _expire_lost_acks(self) -> None:
+        now = time.monotonic()
+        with self._dispatch_lock:
+            for drone in self._drones:
+                if drone._in_flight and drone._ack_deadline <= now:
+                    log.warning("no response from %s to %s", drone.ip, drone._in_flight)
+                    self._complete_command(drone)
+                    drone._hold_until = now + STALE_ACK_GRACE
+
+    # Mark the in-flight command of drone as done, so its next one can be sent
+    # Caller must hold the dispatch lock
+    def _complete_command(self, drone: TelloDrone) -> None:
+        drone._in_flight = None
+        if not drone._command_queue:
+            drone._idle_event.set()
+
+    # Release every drone waiting for the signal
+    def send_signal(self, signal: str) -> None:
+        with self._dispatch_lock:
+            self._signals[signal] = True
+        self._wake_dispatcher()
+
+    # Block until every drone has executed all of its queued commands
+    def sync(self):
+        for drone in self._drones:
+            drone.flush()
+        for drone in self._drones:
+            drone._idle_event.wait()
+
+    # Queue cmd on every drone and let the dispatcher send them all in one pass,
+    # then wait until every drone has gone idle
+    # Drones already shut down are left out, nothing would ever send their queue
+    # Returns False if some drone is still busy when timeout runs out
+    def broadcast(self, cmd: bytes, timeout: float = 8.0) -> bool:
+        with self._dispatch_lock:
+            drones = [drone for drone in self._drones if drone._sock is not None]
+        for drone in drones:
+            drone.flush()
+        with self._dispatch_lock:
+            # a queued shutdown may have gone out meanwhile
+            drones = [drone for drone in drones if drone._sock is not None]
+            for drone in drones:
+                drone._command_queue.append(cmd)
+                drone._idle_event.clear()
+        self._wake_dispatcher()
+
+        deadline = time.monotonic() + timeout
+        for drone in drones:
+            if not drone._idle_event.wait(max(0.0, deadline - time.monotonic())):
+                return False
+        return True
@@ -2,21 +2,80 @@ import sys
 import traceback
 import tellopy
 import av
+from av.video.reformatter import VideoReformatter
 import cv2.cv2 as cv2  # for avoidance of pylint error
-import numpy
-import time
 import datetime
+import queue
+import threading
 
 from swarm_manager import TelloDrone, SwarmManager
 from typing import List
 
 ROUTER_SSID_PASSWORD = "U+Net2AE6", "1C4C024328"
+# keys handled in the video window
+KEY_S = ord('s')
+KEY_Q = ord('q')
+# frames wider than this are scaled down for display, saved pictures keep full resolution
+DISPLAY_WIDTH = 640
+
+# hands item to the display, dropping the oldest one if it has fallen behind
+def put_latest(frames: queue.Queue, item):
+    try:
+        frames.put_nowait(item)
+    except queue.Full:
+        try:
+            frames.get_nowait()
+        except queue.Empty:
+            pass
+        frames.put_nowait(item)
+
+# decodes the stream on its own thread so the GUI never waits on H.264 decoding
+# queues (display image, decoded frame), and None once decoding ends so the display loop can stop
+def decode_frames(container, frames: queue.Queue, stop: threading.Event):
+    # reused for every frame, so libswscale keeps its scaling context
+    reformatter = VideoReformatter()
+    try:
+        # skip first 300 frames, dropping their packets without decoding them
+        frame_skip = 300
+        # the decoder has to start from a keyframe, or the picture comes out corrupt
+        keyframe_seen = False
+        for packet in container.demux(video=0):
+            if stop.is_set():
+                break
+            if 0 < frame_skip:
+                frame_skip = frame_skip - 1
+                continue
+            keyframe_seen = keyframe_seen or packet.is_keyframe
+            if not keyframe_seen:
+                continue
+            for frame in packet.decode():
+                (width, height) = (frame.width, frame.height)
+                if DISPLAY_WIDTH < width:
+                    (width, height) = (DISPLAY_WIDTH, height * DISPLAY_WIDTH // width)
+                # let libswscale scale and convert straight to OpenCV's BGR layout in one pass
+                image = reformatter.reformat(frame, width=width, height=height, format='bgr24',
+                                             interpolation='AREA').to_ndarray()
+                put_latest(frames, (image, frame))
+    except Exception as ex:
+        print(ex)
+    finally:
+        put_latest(frames, None)
+
+# saves (filename, frame) captures at full resolution until None is queued,
+# so neither the BGR conversion nor JPEG encoding stalls the display
+def write_images(captures: queue.Queue):
+    for (filename, frame) in iter(captures.get, None):
+        cv2.imwrite(filename, frame.to_ndarray(format='bgr24'))
 
 def main():
     manager = SwarmManager(*ROUTER_SSID_PASSWORD)
     manager.find_drones_on_network(1)
     drones: List[TelloDrone] = manager.get_connected_drones()
     drone = drones[0]
+    stop = threading.Event()
+    captures: queue.Queue = queue.Queue()
+    writer = threading.Thread(target=write_images, args=(captures,))
+    writer.start()
 
     try:
         n=0
@@ -30,33 +89,44 @@ def main():
                 print(ave)
                 print('retry...')
 
-        # skip first 300 frames
-        frame_skip = 300
+        # let libavcodec decode H.264 on as many threads as there are cores
+        stream = container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        stream.thread_count = 0
+
+        frames: queue.Queue = queue.Queue(maxsize=2)
+        decoder = threading.Thread(target=decode_frames, args=(container, frames, stop), daemon=True)
+        decoder.start()
+
+        # bound once, so the frame loop doesn't look them up on every frame
+        next_frame, capture = frames.get, captures.put
+        imshow, wait_key, now = cv2.imshow, cv2.waitKey, datetime.datetime.now
+        key_s, key_q = KEY_S, KEY_Q
         while True:
-            for frame in container.decode(video=0):
-                if 0 < frame_skip:
-                    frame_skip = frame_skip - 1
-                    continue
-                start_time = time.time()
-                image = cv2.cvtColor(numpy.array(frame.to_image()), cv2.COLOR_RGB2BGR)
-                cv2.imshow('Original', image)
+            item = next_frame()
+            if item is None:
+                break
+            (image, frame) = item
+            imshow('Original', image)
 
-      #  resize = cv2.resize(frame, (new_w, new_h)) # <- resize for improved performance
-        # Display the resulting frame
-       
-                if cv2.waitKey(1) & 0xFF == ord('s'):
-                    cv2.imwrite(now.strftime("%S.jpg"),image) # writes image test.bmp to disk
-                    print("Take Picture")
-                    n=n+1
-       
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
+            # poll the keyboard once per frame, each waitKey waits at least 1ms
+            key = wait_key(1) & 0xFF
+            if key == key_s:
+                # the decoded frame is never written to again, so it can go to the writer as is
+                capture((now().strftime("%S.jpg"), frame))
+                print("Take Picture")
+                n=n+1
+            elif key == key_q:
+                break
 
     except Exception as ex:
         exc_type, exc_value, exc_traceback = sys.exc_info()
         traceback.print_exception(exc_type, exc_value, exc_traceback)
         print(ex)
     finally:
+        stop.set()
+        # the writer finishes the queued pictures before it exits
+        captures.put(None)
         drone.quit()
         cv2.destroyAllWindows()
 